@@ -1,67 +1,179 @@
 # analysis_and_viz.py
 import pandas as pd
+import numpy as np
+import matplotlib
+matplotlib.use('Agg') # Plots are only saved to files; select the non-interactive backend before pyplot loads
 import matplotlib.pyplot as plt
 import seaborn as sns
 from wordcloud import WordCloud # pip install wordcloud
-import re
-from collections import Counter # For efficient word counting
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
-def analyze_and_visualize_chunked(cleaned_data_file='cleaned_data.csv', chunksize=20000): # Adjust chunksize as needed
+# Publication years are counted into a fixed histogram covering [YEAR_BASE, YEAR_END)
+YEAR_BASE = 1500
+YEAR_END = 2100
+# Title word counts are only ever plotted as a histogram, so bin counts are accumulated
+# per chunk instead of keeping every value
+TITLE_WC_BIN_EDGES = np.linspace(0, 200, 51)
+ANALYSIS_COLUMNS = ['year', 'source_x', 'title', 'title_word_count']
+# Title tokenizer: split on runs of non-word characters. Arrow's regex kernels run on RE2
+# (linear time, no backtracking); the options object is built once and reused per chunk.
+TITLE_SPLIT_OPTIONS = pc.SplitPatternOptions(pattern=r'[^\pL\pN_]+')
+
+def _empty_word_counts():
+    """Returns an empty (word, count) table to fold per-chunk word counts into."""
+    return pa.table({'word': pa.array([], pa.large_string()), 'count': pa.array([], pa.int64())})
+
+def _merge_word_counts(*word_count_tables):
+    """Sums (word, count) tables into one with an Arrow hash group-by."""
+    return (pa.concat_tables(word_count_tables)
+            .group_by('word').aggregate([('count', 'sum')])
+            .select(['word', 'count_sum']).rename_columns(['word', 'count']))
+
+def _process_chunk(batch, source_categories):
+    """
+    Computes the partial aggregates of one record batch:
+    (year counts, source counts, (word, count) table, title word count histogram).
+    All of them merge across chunks by simple addition.
+    """
+    year_counts = np.zeros(YEAR_END - YEAR_BASE, dtype=np.int64) # One slot per possible year
+    source_counts = np.zeros(len(source_categories), dtype=np.int64)
+    word_counts = _empty_word_counts()
+    title_wc_hist = np.zeros(len(TITLE_WC_BIN_EDGES) - 1, dtype=np.int64)
+
+    # Titles stay in Arrow; only the small numeric/source columns go through pandas,
+    # as nullable Int16 (not float64) and 'source_x' as a category
+    chunk_df = batch.select(['year', 'source_x', 'title_word_count']).to_pandas(
+        types_mapper={pa.int16(): pd.Int16Dtype()}.get)
+
+    # 1. Count papers by publication year
+    if 'year' in chunk_df.columns:
+        # Drop NaNs (mapped to -1) and out-of-range years, then count by offset from YEAR_BASE
+        years = chunk_df['year'].to_numpy(dtype=np.int32, na_value=-1)
+        years = years[(years >= YEAR_BASE) & (years < YEAR_END)]
+        year_counts += np.bincount(years - YEAR_BASE, minlength=year_counts.size)
+
+    # 2. Count papers by source
+    if 'source_x' in chunk_df.columns: # Adjust column name if needed
+        # Recode onto the global categories (an integer remap) and count codes; -1 is missing.
+        # set_categories rather than astype: astype treats the same categories in a different
+        # order as an equal dtype and keeps the chunk's own codes.
+        source_codes = chunk_df['source_x'].cat.set_categories(source_categories).cat.codes.to_numpy()
+        source_counts += np.bincount(source_codes[source_codes >= 0], minlength=len(source_categories))
+
+    # 3. Count words for frequent word analysis
+    if 'title' in batch.schema.names:
+        # Tokenize with Arrow kernels instead of regex over one big joined string.
+        # Splitting on non-word characters and keeping purely alphabetic tokens of
+        # 3+ letters matches the old r'\b[a-zA-Z]{3,}\b' pattern.
+        # Only the kept tokens are lowercased rather than a full lowercase copy of the title
+        # column. This is not exactly case-independent: the few non-ASCII letters that lowercase
+        # to ASCII (U+0130 'İ', U+212A Kelvin sign) now drop their token instead of yielding one.
+        tokens = pc.split_pattern_regex(batch.column('title'), options=TITLE_SPLIT_OPTIONS).flatten()
+        tokens = pc.utf8_lower(tokens.filter(pc.and_(pc.greater_equal(pc.utf8_length(tokens), 3),
+                                                     pc.ascii_is_alpha(tokens))))
+        # Count in Arrow so no token ever becomes a Python str
+        token_counts = pc.value_counts(tokens)
+        word_counts = pa.table({'word': token_counts.field('values').cast(pa.large_string()),
+                                'count': token_counts.field('counts')})
+
+    # 4. Bin the title word count distribution
+    if 'title_word_count' in chunk_df.columns:
+         # Drop NaNs (mapped to -1), fold outliers into the last bin
+         title_wc_values = chunk_df['title_word_count'].to_numpy(dtype=np.int32, na_value=-1)
+         title_wc_values = np.minimum(title_wc_values[title_wc_values >= 0], TITLE_WC_BIN_EDGES[-1])
+         title_wc_hist += np.histogram(title_wc_values, bins=TITLE_WC_BIN_EDGES)[0]
+
+    return year_counts, source_counts, word_counts, title_wc_hist
+
+def _process_row_group(cleaned_data_file, row_group, chunksize, source_categories):
+    """
+    Worker entry point: reads one Parquet row group in batches of `chunksize` rows and
+    returns its merged partial aggregates plus the number of rows read. Workers open the
+    file themselves so only row group numbers and small summaries cross process boundaries.
+    """
+    year_counts = np.zeros(YEAR_END - YEAR_BASE, dtype=np.int64)
+    source_counts = np.zeros(len(source_categories), dtype=np.int64)
+    word_count_tables = [_empty_word_counts()] # Per-batch (word, count) tables, merged once at the end
+    title_wc_hist = np.zeros(len(TITLE_WC_BIN_EDGES) - 1, dtype=np.int64)
+    rows = 0
+
+    for batch in pq.ParquetFile(cleaned_data_file).iter_batches(
+            batch_size=chunksize, row_groups=[row_group], columns=ANALYSIS_COLUMNS):
+        chunk_years, chunk_sources, chunk_words, chunk_title_wc = _process_chunk(batch, source_categories)
+        year_counts += chunk_years
+        source_counts += chunk_sources
+        word_count_tables.append(chunk_words)
+        title_wc_hist += chunk_title_wc
+        rows += batch.num_rows
+
+    # One group-by over all batches instead of re-aggregating the running table per batch
+    return year_counts, source_counts, _merge_word_counts(*word_count_tables), title_wc_hist, rows
+
+def analyze_and_visualize_chunked(cleaned_data_file='cleaned_data.parquet', chunksize=20000, max_workers=None, # Adjust chunksize as needed
+                                  categories_file='source_categories.json'):
     """
     Performs basic analysis and creates visualizations from the cleaned data,
-    processing it in chunks to manage memory usage.
+    streaming it from Parquet in record batches to manage memory usage.
+    Row groups are processed in parallel by `max_workers` processes (default: one per CPU).
+    Source categories come from `categories_file` (written by data_cleaning.py) when it exists.
     """
     print(f"Starting analysis and visualization for '{cleaned_data_file}' using chunking (chunksize={chunksize})...")
     
     # --- Aggregators for results across chunks ---
-    year_counts_agg = pd.Series(dtype='int64') # Use appropriate dtype
-    source_counts_agg = pd.Series(dtype='int64')
-    all_words = Counter() # Efficiently count words
-    title_word_counts_list = [] # Collect title word counts for histogram
+    year_counts_agg = np.zeros(YEAR_END - YEAR_BASE, dtype=np.int64) # One slot per possible year
+    word_counts_agg = _empty_word_counts() # Running (word, count) table
+    title_wc_hist = np.zeros(len(TITLE_WC_BIN_EDGES) - 1, dtype=np.int64)
 
     try:
         print("Loading cleaned data for analysis (chunk by chunk)...")
-        chunk_iter = pd.read_csv(cleaned_data_file, chunksize=chunksize, low_memory=False)
+        # One global category list so every chunk's sources can be counted by integer code.
+        # Use the list saved during cleaning; otherwise union the per-batch dictionaries of
+        # the dictionary-encoded 'source_x' column.
+        if os.path.exists(categories_file):
+            with open(categories_file, encoding='utf-8') as f:
+                source_categories = pd.Index(json.load(f))
+        else:
+            source_column = pq.read_table(cleaned_data_file, columns=['source_x']).column('source_x')
+            source_categories = pd.Index(pc.unique(pa.chunked_array(
+                [chunk.dictionary for chunk in source_column.chunks], type=source_column.type.value_type)).to_pylist())
+        source_counts_agg = np.zeros(len(source_categories), dtype=np.int64)
+
+        # Each row group is analyzed independently and the partial results are summed,
+        # so the row groups can be fanned out over a process pool.
+        num_row_groups = pq.ParquetFile(cleaned_data_file).num_row_groups
+        max_workers = max(1, min(max_workers or os.cpu_count() or 1, num_row_groups))
         
         total_rows_processed = 0
-        for i, chunk_df in enumerate(chunk_iter):
-            print(f"Analyzing chunk {i+1}...")
-            total_rows_processed += len(chunk_df)
-            
-            # --- Analysis on the current chunk ---
-            
-            # 1. Aggregate paper counts by publication year
-            if 'year' in chunk_df.columns:
-                chunk_year_counts = chunk_df['year'].value_counts()
-                # Add counts for overlapping years
-                year_counts_agg = year_counts_agg.add(chunk_year_counts, fill_value=0).astype('int64')
-            
-            # 2. Aggregate top sources
-            if 'source_x' in chunk_df.columns: # Adjust column name if needed
-                chunk_source_counts = chunk_df['source_x'].value_counts()
-                source_counts_agg = source_counts_agg.add(chunk_source_counts, fill_value=0).astype('int64')
-
-            # 3. Collect words for frequent word analysis
-            if 'title' in chunk_df.columns:
-                # Combine titles in this chunk, handling potential NaNs
-                titles_text_chunk = ' '.join(chunk_df['title'].dropna().astype(str))
-                # Simple cleaning and word extraction for this chunk
-                words_chunk = re.findall(r'\b[a-zA-Z]{3,}\b', titles_text_chunk.lower())
-                # Update the overall word counter
-                all_words.update(words_chunk)
-
-            # 4. Collect title word counts for distribution
-            if 'title_word_count' in chunk_df.columns:
-                 # Drop NaNs and convert to list to append
-                 title_word_counts_list.extend(chunk_df['title_word_count'].dropna().tolist())
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            partials = executor.map(_process_row_group, repeat(cleaned_data_file), range(num_row_groups),
+                                    repeat(chunksize), repeat(source_categories))
+            for i, (rg_years, rg_sources, rg_words, rg_title_wc, rg_rows) in enumerate(partials):
+                print(f"Analyzed row group {i+1}/{num_row_groups} ({rg_rows} rows)...")
+                total_rows_processed += rg_rows
+                year_counts_agg += rg_years
+                source_counts_agg += rg_sources
+                word_counts_agg = _merge_word_counts(word_counts_agg, rg_words)
+                title_wc_hist += rg_title_wc
                  
         print(f"\nFinished processing {total_rows_processed} rows in total.")
 
         # --- Finalize aggregations after all chunks ---
-        year_counts_final = year_counts_agg.sort_index()
-        top_sources_final = source_counts_agg.head(10)
-        top_words_final = pd.Series(all_words).head(50) # Convert Counter to Series for top 50
+        year_counts_final = pd.Series(year_counts_agg, index=np.arange(YEAR_BASE, YEAR_END))
+        year_counts_final = year_counts_final[year_counts_final > 0]
+        top_n = min(10, len(source_categories))
+        top_source_ids = np.argpartition(-source_counts_agg, top_n - 1)[:top_n] if top_n else np.array([], dtype=np.intp)
+        top_source_ids = top_source_ids[np.argsort(-source_counts_agg[top_source_ids], kind='stable')]
+        top_sources_final = pd.Series(source_counts_agg[top_source_ids], index=source_categories[top_source_ids])
+        top_sources_final = top_sources_final[top_sources_final > 0] # Top 10 by paper count
+        word_counts_agg = word_counts_agg.sort_by([('count', 'descending')])
+        top_words_table = word_counts_agg.slice(0, 50)
+        top_words_final = pd.Series(top_words_table['count'].to_numpy(), index=top_words_table['word'].to_pylist()) # Top 50 by frequency
         print("\n--- Final Aggregated Results ---")
         print("Paper counts by year (top 10):")
         print(year_counts_final.head(10))
@@ -76,75 +188,81 @@ def analyze_and_visualize_chunked(cleaned_data_file='cleaned_data.csv', chunksiz
         # Ensure output directory exists
         os.makedirs('visualizations', exist_ok=True)
 
+        # One figure is reused for every plot: clear it, draw, save. Sizes are set per plot
+        # and the figure is closed only once at the end.
+        fig = plt.figure(figsize=(12, 6))
+
         # 1. Plot number of publications over time
-        plt.figure(figsize=(12, 6))
         if not year_counts_final.empty:
-            plt.plot(year_counts_final.index, year_counts_final.values, marker='o', markersize=4)
-            plt.title('Number of Publications by Year')
-            plt.xlabel('Year')
-            plt.ylabel('Number of Papers')
-            plt.grid(True, linestyle='--', alpha=0.5)
+            fig.clf()
+            fig.set_size_inches(12, 6)
+            ax = fig.add_subplot(111)
+            ax.plot(year_counts_final.index, year_counts_final.values, marker='o', markersize=4)
+            ax.set_title('Number of Publications by Year')
+            ax.set_xlabel('Year')
+            ax.set_ylabel('Number of Papers')
+            ax.grid(True, linestyle='--', alpha=0.5)
             # Improve x-axis if there are many years
             if len(year_counts_final) > 20:
-                plt.xticks(rotation=45, ha='right')
-            plt.tight_layout()
-            plt.savefig('visualizations/publications_by_year.png')
+                plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+            fig.tight_layout()
+            fig.savefig('visualizations/publications_by_year.png', dpi=100, bbox_inches=None)
             print("Saved plot: visualizations/publications_by_year.png")
         else:
             print("No data to plot for publications by year.")
-        plt.close() # Close the figure to free memory
 
         # 2. Bar chart of top sources
-        plt.figure(figsize=(10, 6))
         if not top_sources_final.empty:
-            sns.barplot(x=top_sources_final.values, y=top_sources_final.index, palette='viridis')
-            plt.title('Top Publishing Sources')
-            plt.xlabel('Number of Papers')
-            plt.ylabel('Source')
-            plt.tight_layout()
-            plt.savefig('visualizations/top_sources.png')
+            fig.clf()
+            fig.set_size_inches(10, 6)
+            ax = fig.add_subplot(111)
+            sns.barplot(x=top_sources_final.values, y=top_sources_final.index, ax=ax, palette='viridis')
+            ax.set_title('Top Publishing Sources')
+            ax.set_xlabel('Number of Papers')
+            ax.set_ylabel('Source')
+            fig.tight_layout()
+            fig.savefig('visualizations/top_sources.png', dpi=100, bbox_inches=None)
             print("Saved plot: visualizations/top_sources.png")
         else:
              print("No data found for top sources plot.")
-        plt.close()
 
         # 3. Word cloud of paper titles
-        plt.figure(figsize=(12, 6))
-        # Combine all collected words into a single string, weighted by frequency
-        # WordCloud can take a frequency dictionary directly
-        if all_words:
-            wordcloud = WordCloud(width=1200, height=600, background_color='white', max_words=200).generate_from_frequencies(all_words)
-            plt.imshow(wordcloud, interpolation='bilinear')
-            plt.axis("off")
-            plt.title('Word Cloud of Paper Titles')
-            plt.tight_layout()
-            plt.savefig('visualizations/title_wordcloud.png')
+        # WordCloud takes a frequency dictionary directly; only the 200 words it draws are
+        # passed in (word_counts_agg is already sorted), and the bitmap it renders is saved
+        # as-is instead of being redrawn through a matplotlib figure
+        if word_counts_agg.num_rows > 0:
+            cloud_words = word_counts_agg.slice(0, 200)
+            cloud_frequencies = dict(zip(cloud_words['word'].to_pylist(), cloud_words['count'].to_pylist()))
+            wordcloud = WordCloud(width=1200, height=600, background_color='white', max_words=200).generate_from_frequencies(cloud_frequencies)
+            wordcloud.to_file('visualizations/title_wordcloud.png')
             print("Saved plot: visualizations/title_wordcloud.png")
         else:
              print("No title text available for word cloud.")
-        plt.close()
 
         # 4. Distribution of title word counts
-        plt.figure(figsize=(10, 6))
-        if title_word_counts_list:
-            plt.hist(title_word_counts_list, bins=50, edgecolor='black', alpha=0.7) # Increase bins for detail
-            plt.title('Distribution of Title Word Counts')
-            plt.xlabel('Number of Words in Title')
-            plt.ylabel('Frequency')
-            plt.grid(axis='y', linestyle='--', alpha=0.7)
-            plt.tight_layout()
-            plt.savefig('visualizations/title_word_count_dist.png')
+        if title_wc_hist.any():
+            fig.clf()
+            fig.set_size_inches(10, 6)
+            ax = fig.add_subplot(111)
+            ax.bar(TITLE_WC_BIN_EDGES[:-1], title_wc_hist, width=np.diff(TITLE_WC_BIN_EDGES), align='edge',
+                   edgecolor='black', alpha=0.7)
+            ax.set_title('Distribution of Title Word Counts')
+            ax.set_xlabel('Number of Words in Title')
+            ax.set_ylabel('Frequency')
+            ax.grid(axis='y', linestyle='--', alpha=0.7)
+            fig.tight_layout()
+            fig.savefig('visualizations/title_word_count_dist.png', dpi=100, bbox_inches=None)
             print("Saved plot: visualizations/title_word_count_dist.png")
         else:
              print("No title word count data available for distribution plot.")
-        plt.close()
+        plt.close(fig) # Close the shared figure to free memory
 
         print("\nAnalysis and visualization complete. Plots saved in 'visualizations/' folder.")
 
     except FileNotFoundError:
         print(f"Error: Cleaned data file '{cleaned_data_file}' not found.")
-    except pd.errors.EmptyDataError:
-        print(f"Error: Cleaned data file '{cleaned_data_file}' is empty.")
+    except pa.ArrowInvalid as e:
+        print(f"Error: Could not read cleaned data file '{cleaned_data_file}': {e}")
     except MemoryError as me:
         print(f"MemoryError encountered during chunked analysis: {me}")
         print("This is unexpected if chunking is working. Consider reducing chunksize further.")
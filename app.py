@@ -1,13 +1,22 @@
 # app.py (Loading a Sample)
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import seaborn as sns
+import json
+import math
 import os
+import threading
 import random
 
 # --- Configuration ---
-DATA_FILE = 'cleaned_data.csv'
+DATA_FILE = 'cleaned_data.parquet'
+CATEGORIES_FILE = 'source_categories.json'  # Distinct 'source_x' values, written by data_cleaning.py
 VIZ_DIR = 'visualizations'
 # --- Sample Configuration ---
 SAMPLE_FRAC = 0.05  # Load 5% of the data. Adjust this (e.g., 0.01 for 1%, 0.1 for 10%) based on your RAM and desired responsiveness.
@@ -22,51 +31,32 @@ def load_sampled_data():
              st.error(f"Data file '{DATA_FILE}' not found. Please run the cleaning script first.")
              return pd.DataFrame()
 
-        # --- Estimate total lines (optional, for info) ---
-        # This can be slow for very large files, but gives an idea.
-        # total_lines = sum(1 for line in open(DATA_FILE, 'r', encoding='utf-8'))
-        # st.info(f"Total lines estimated in '{DATA_FILE}': ~{total_lines:,}")
-        # lines_to_skip = sorted(random.sample(range(1, total_lines), int(total_lines * (1 - SAMPLE_FRAC))))
-        # data = pd.read_csv(DATA_FILE, skiprows=lines_to_skip)
-
-        # --- Simpler approach: Read all, then sample (still needs to read once into memory briefly) ---
-        # This might still fail if even reading the file header uses too much memory in one go with 1.5GB.
-        # Let's try the chunking approach for sampling.
-
-        # --- Chunking approach for sampling ---
+        # --- Row-group sample ---
+        # Pick ~SAMPLE_FRAC of the Parquet row groups at random and read only those (and only
+        # the columns the app displays), so the bytes read shrink along with the sample.
         print(f"Loading a sample ({SAMPLE_FRAC*100:.1f}%) of data from '{DATA_FILE}'...")
         st.info(f"Loading a sample ({SAMPLE_FRAC*100:.1f}%) of the data for interactive exploration...")
 
-        chunks = []
-        chunk_count = 0
-        total_rows_read = 0
-        # Read in chunks and sample from each
-        for chunk in pd.read_csv(DATA_FILE, chunksize=10000, low_memory=False):
-            chunk_count += 1
-            total_rows_read += len(chunk)
-            # Sample the chunk
-            sampled_chunk = chunk.sample(frac=SAMPLE_FRAC, random_state=SAMPLE_SEED + chunk_count) # Vary seed slightly per chunk
-            chunks.append(sampled_chunk)
-            # Optional: Add a stop condition if you know the approximate size and want to limit read time
-            # if total_rows_read > 500000: # e.g., stop after reading ~500k rows
-            #     st.warning("Stopped reading early for sampling.")
-            #     break
-
-        if not chunks:
-            st.error("No data chunks were read.")
+        columns = ['title', 'abstract', 'year', 'source_x', 'title_word_count']
+        rng = np.random.default_rng(SAMPLE_SEED)
+        data_version = os.path.getmtime(DATA_FILE) # Identifies the file this sample was drawn from
+        parquet_file = pq.ParquetFile(DATA_FILE)
+        num_row_groups = parquet_file.num_row_groups
+        if num_row_groups == 0:
+            st.error("No data rows were read.")
             return pd.DataFrame()
 
-        # Concatenate the sampled chunks
-        data = pd.concat(chunks, ignore_index=True)
-        # Re-sample the final concatenated dataframe to get the exact overall fraction
-        # This step helps ensure the final sample size is closer to the desired fraction
-        # especially if chunk sizes vary or reading was stopped early.
-        final_sample_size = int(len(data) * SAMPLE_FRAC)
-        if final_sample_size > 0:
-             data = data.sample(n=final_sample_size, random_state=SAMPLE_SEED)
-        else:
-             # If the concatenated sample is tiny, just use it
-             pass
+        k = max(1, round(num_row_groups * SAMPLE_FRAC))
+        row_group_ids = np.sort(rng.choice(num_row_groups, k, replace=False))
+        table = parquet_file.read_row_groups(row_group_ids.tolist(), columns=columns)
+
+        # With few row groups, k/num_row_groups overshoots SAMPLE_FRAC (a single-group file
+        # would be read whole), so thin the rows read to keep the overall fraction.
+        keep_prob = min(1.0, SAMPLE_FRAC * num_row_groups / k)
+        if keep_prob < 1.0:
+            table = table.filter(pa.array(rng.random(table.num_rows) < keep_prob))
+        data = table.to_pandas()
+        data.attrs['data_version'] = data_version # Carried along by filtering and copies
 
         print(f"Sample loaded. Shape: {data.shape}")
         st.success(f"Sample loaded successfully! (Sample size: {len(data):,} rows)")
@@ -76,9 +66,16 @@ def load_sampled_data():
         if 'year' in data.columns:
              data['year'] = pd.to_numeric(data['year'], errors='coerce', downcast='integer')
 
-        # Convert 'source_x' (or your source column) to categorical if it has repeated strings
+        # 'source_x' arrives as a categorical (it is stored dictionary-encoded). Align it with the
+        # global category list saved during cleaning: an integer remap of the codes, not a
+        # hash of every string as astype('category') would do.
         if 'source_x' in data.columns:
-            data['source_x'] = data['source_x'].astype('category')
+            if os.path.exists(CATEGORIES_FILE):
+                with open(CATEGORIES_FILE, encoding='utf-8') as f:
+                    source_categories = json.load(f)
+                data['source_x'] = data['source_x'].cat.set_categories(source_categories)
+            else:
+                data['source_x'] = data['source_x'].astype('category')
 
         # Potentially convert 'title_word_count' if it's always small integers
         # Check range first: print(data['title_word_count'].describe())
@@ -91,9 +88,6 @@ def load_sampled_data():
     except FileNotFoundError:
         st.error(f"Data file '{DATA_FILE}' not found. Please run the cleaning script first.")
         return pd.DataFrame()
-    except pd.errors.EmptyDataError:
-        st.error(f"Data file '{DATA_FILE}' is empty.")
-        return pd.DataFrame()
     except MemoryError as me:
         st.error("MemoryError: Even sampling failed, likely due to extremely large file size or limited system RAM. Consider reducing SAMPLE_FRAC or checking system resources.")
         st.write(f"Details: {me}")
@@ -115,6 +109,46 @@ def load_image(image_path):
         # st.warning(f"Image not found: {image_path}") 
         return None
 
+@st.cache_data(max_entries=128)
+def filtered_counts(_filtered_df, data_version, year_range, selected_sources):
+    """
+    Returns (papers per year, top 10 sources) for the filtered sample from a single
+    group-by pass. `_filtered_df` is not hashed (leading underscore): it is fully
+    determined by the version of the loaded sample and the filter state, which form the cache key,
+    so repeated reruns with unchanged filters skip the scan.
+    """
+    counts = _filtered_df.groupby(['year', 'source_x'], observed=True, dropna=False).size()
+    year_counts = counts.groupby(level='year').sum().sort_index() # Level group-bys drop missing keys
+    top_sources = counts.groupby(level='source_x', observed=True).sum().sort_values(ascending=False).head(10)
+    return year_counts, top_sources
+
+def nice_ceil(value):
+    """Rounds a positive count up to the next 1-2-5 step (e.g. 37 -> 50, 180 -> 200)."""
+    step = 10 ** math.floor(math.log10(value))
+    return next(m * step for m in (1, 2, 5, 10) if value <= m * step)
+
+@st.cache_resource(max_entries=4, ttl=600) # One figure per axis window; each holds ~10 MiB of 200 dpi buffers
+def make_year_fig(x_min, x_max, y_max):
+    """
+    Builds the dynamic year plot for fixed axis limits and renders its static parts
+    (axes, ticks, labels, grid) once. Reruns only blit the line onto the saved background.
+    Returns (fig, ax, line, background, lock); the lock serializes sessions sharing the figure.
+    """
+    fig = Figure(figsize=(8, 4), dpi=200) # Same resolution st.pyplot renders the other plots at
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_title('Filtered Publications by Year (Sample)')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Number of Papers (Sample)')
+    ax.grid(True)
+    ax.set_xlim(x_min - 0.5, x_max + 0.5)
+    ax.set_ylim(0, y_max * 1.05)
+    fig.tight_layout()
+    line, = ax.plot([], [], marker='o', animated=True) # Excluded from the background render
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+    return fig, ax, line, background, threading.Lock()
+
 # --- Streamlit App ---
 st.set_page_config(page_title="CORD-19 Explorer (Sample)", layout="wide") # Note the (Sample) in title
 
@@ -147,6 +181,7 @@ if not df.empty:
         filtered_df = df.copy() # Show all if no year filter possible
 
     # Filter by Source
+    selected_sources = []
     if 'source_x' in df.columns:
         unique_sources = df['source_x'].cat.categories if hasattr(df['source_x'], 'cat') else df['source_x'].dropna().unique()
         if len(unique_sources) > 0:
@@ -220,22 +255,25 @@ if not df.empty:
     # --- Create Plots Dynamically in Streamlit (from the Sample) ---
     st.markdown("---")
     st.subheader("Dynamic Plots (Based on Sample Filters)")
+    # Cache key for the dynamic plot aggregates: version of the loaded sample plus filter state.
+    # The version is recorded at load time, so no file-system call is made per rerun.
+    counts_key = (df.attrs.get('data_version'), tuple(year_range), tuple(sorted(selected_sources)))
 
     # Dynamic Year Plot
     if not filtered_df.empty and 'year' in filtered_df.columns:
-        plot_data_year = filtered_df.dropna(subset=['year'])
-        if not plot_data_year.empty:
-            year_counts_filtered = plot_data_year['year'].value_counts().sort_index()
-            if not year_counts_filtered.empty:
-                fig1, ax1 = plt.subplots(figsize=(8, 4))
-                ax1.plot(year_counts_filtered.index, year_counts_filtered.values, marker='o')
-                ax1.set_title('Filtered Publications by Year (Sample)')
-                ax1.set_xlabel('Year')
-                ax1.set_ylabel('Number of Papers (Sample)')
-                ax1.grid(True)
-                st.pyplot(fig1)
-            else:
-                st.write("No data available for the selected year range/source in the sample (after filtering).")
+        year_counts_filtered, _ = filtered_counts(filtered_df, *counts_key)
+        if not year_counts_filtered.empty:
+            # The axes only change with the year range or the 1-2-5 step of the peak count,
+            # so most filter changes reuse a cached background and just redraw the line
+            fig1, ax1, line1, background1, lock1 = make_year_fig(
+                int(year_range[0]), int(year_range[1]), nice_ceil(int(year_counts_filtered.max())))
+            with lock1:
+                fig1.canvas.restore_region(background1)
+                line1.set_data(year_counts_filtered.index, year_counts_filtered.values)
+                ax1.draw_artist(line1)
+                fig1.canvas.blit(ax1.bbox)
+                year_plot = np.asarray(fig1.canvas.buffer_rgba()).copy()
+            st.image(year_plot, use_column_width=True)
         else:
              st.write("No data with valid years available for dynamic year plot in the sample.")
     elif not filtered_df.empty:
@@ -245,18 +283,14 @@ if not df.empty:
 
     # Dynamic Top Sources Plot
     if not filtered_df.empty and 'source_x' in filtered_df.columns:
-        plot_data_source = filtered_df.dropna(subset=['source_x'])
-        if not plot_data_source.empty:
-            top_sources_filtered = plot_data_source['source_x'].value_counts().head(10)
-            if not top_sources_filtered.empty:
-                fig2, ax2 = plt.subplots(figsize=(8, 4))
-                sns.barplot(x=top_sources_filtered.values, y=top_sources_filtered.index, ax=ax2, palette='viridis')
-                ax2.set_title('Top Sources (Filtered Sample)')
-                ax2.set_xlabel('Number of Papers (Sample)')
-                ax2.set_ylabel('Source')
-                st.pyplot(fig2)
-            else:
-                 st.write("No source data available for the selected filters in the sample (after filtering).")
+        _, top_sources_filtered = filtered_counts(filtered_df, *counts_key)
+        if not top_sources_filtered.empty:
+            fig2, ax2 = plt.subplots(figsize=(8, 4))
+            sns.barplot(x=top_sources_filtered.values, y=top_sources_filtered.index, ax=ax2, palette='viridis')
+            ax2.set_title('Top Sources (Filtered Sample)')
+            ax2.set_xlabel('Number of Papers (Sample)')
+            ax2.set_ylabel('Source')
+            st.pyplot(fig2)
         else:
              st.write("No data with valid sources available for dynamic source plot in the sample.")
     elif not filtered_df.empty:
@@ -266,4 +300,4 @@ if not df.empty:
 
 
 else:
-    st.info("Please ensure the data cleaning step is completed and 'cleaned_data.csv' exists.")
+    st.info("Please ensure the data cleaning step is completed and 'cleaned_data.parquet' exists.")
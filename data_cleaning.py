@@ -1,93 +1,129 @@
 # data_cleaning.py
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
+import pyarrow.parquet as pq
+import json
 import os
 
-def clean_data_chunked(input_file='metadata.csv', output_file='cleaned_data.csv', chunksize=10000):
+# Columns read from metadata.csv (only what analysis and the app use); everything else
+# is skipped by the parser
+CLEANING_COLUMNS = ['title', 'abstract', 'publish_time', 'source_x']
+# Bytes buffered in memory before the Parquet output is flushed to disk
+WRITE_BUFFER_SIZE = 8 << 20
+
+def clean_data_chunked(input_file='metadata.csv', output_file='cleaned_data.parquet', block_size=64 << 20,
+                       categories_file='source_categories.json'):
     """
-    Cleans the CORD-19 metadata by reading it in chunks to manage memory:
+    Cleans the CORD-19 metadata by streaming it as Arrow record batches to manage memory:
     - Handles missing values
-    - Converts publish_time to datetime and extracts year
+    - Extracts the year from publish_time (then drops publish_time)
     - Creates new columns (e.g., title word count)
-    - Saves the cleaned data.
+    - Saves the cleaned data as a ZSTD-compressed Parquet file.
+    - Saves the sorted list of distinct 'source_x' values to `categories_file` (JSON),
+      so readers can build the source categorical without scanning the data.
     Assumes 'title' is present to check for essential data.
+    `block_size` is the number of bytes of CSV parsed per batch.
     """
-    print(f"Starting cleaning process for '{input_file}' using chunking (chunksize={chunksize})...")
+    print(f"Starting cleaning process for '{input_file}' using Arrow streaming (block_size={block_size:,} bytes)...")
     
-    first_chunk = True  # Flag to handle header writing for the output CSV
+    sink = None  # Buffered output stream, opened once for the whole run
+    writer = None  # Parquet writer, opened with the schema of the first non-empty chunk
     total_rows_processed = 0
     total_rows_kept = 0
+    sources_seen = set()  # Distinct 'source_x' values across all written chunks
 
     try:
-        # --- Read the file in chunks ---
-        chunk_iter = pd.read_csv(input_file, chunksize=chunksize, low_memory=False)
+        # --- Stream the needed columns in record batches ---
+        # Types are fixed up front: Arrow would otherwise infer them from the first block only.
+        # 'source_x' is dictionary-encoded while parsing, so repeated source names are stored once.
+        # A column missing from the file is read as all-null instead of failing the whole run.
+        column_types = {col: pa.string() for col in CLEANING_COLUMNS}
+        column_types['source_x'] = pa.dictionary(pa.int32(), pa.string())
+        reader = pa_csv.open_csv(
+            input_file,
+            read_options=pa_csv.ReadOptions(block_size=block_size, use_threads=True),
+            convert_options=pa_csv.ConvertOptions(include_columns=CLEANING_COLUMNS, include_missing_columns=True,
+                                                  column_types=column_types, strings_can_be_null=True),
+        )
         
-        for i, chunk_df in enumerate(chunk_iter):
-            print(f"Processing chunk {i+1} (rows ~{i*chunksize + 1} to {(i+1)*chunksize})...")
-            total_rows_processed += len(chunk_df)
+        for i, batch in enumerate(reader):
+            table = pa.Table.from_batches([batch])
+            print(f"Processing chunk {i+1} (rows ~{total_rows_processed + 1} to {total_rows_processed + table.num_rows})...")
+            total_rows_processed += table.num_rows
             
             # --- Cleaning Process for the current chunk ---
             
             # 1. Drop rows where 'title' is missing (often crucial)
             # Store initial count for this chunk
-            initial_chunk_rows = len(chunk_df) 
-            chunk_df.dropna(subset=['title'], inplace=True)
-            rows_after_drop_title = len(chunk_df)
+            initial_chunk_rows = table.num_rows
+            table = table.filter(pc.is_valid(table['title']))
+            rows_after_drop_title = table.num_rows
             print(f"  - Dropped {initial_chunk_rows - rows_after_drop_title} rows (missing 'title') in this chunk.")
 
             # 2. Fill missing 'abstract' with empty string
-            chunk_df['abstract'] = chunk_df['abstract'].fillna('')
+            table = table.set_column(table.schema.get_field_index('abstract'), 'abstract',
+                                     pc.fill_null(table['abstract'], ''))
             # print("  - Filled missing 'abstract' with empty strings.") # Too verbose
 
-            # 3. Convert publish_time to datetime and extract year
-            # print("  - Converting 'publish_time' to datetime...") # Too verbose
-            chunk_df['publish_time'] = pd.to_datetime(chunk_df['publish_time'], errors='coerce')
-            chunk_df['year'] = chunk_df['publish_time'].dt.year
+            # 3. Extract year from publish_time
+            # Dates are 'YYYY-MM-DD' or a bare 'YYYY' and only the year is used downstream,
+            # so take the 4-character prefix instead of parsing full dates. Prefixes that are
+            # not four ASCII digits become null (utf8_is_digit would also accept e.g. Arabic-Indic
+            # digits, which the int cast rejects). publish_time itself is not written out.
+            year_str = pc.utf8_slice_codeunits(table['publish_time'], 0, 4)
+            is_year = pc.and_(pc.ascii_is_decimal(year_str), pc.equal(pc.utf8_length(year_str), 4))
+            year = pc.if_else(is_year, year_str, pa.scalar(None, pa.string())).cast(pa.int16())
+            table = table.drop_columns(['publish_time']).append_column('year', year)
             # print("  - Extracted 'year' from 'publish_time'.") # Too verbose
 
-            # 4. Create a word count for titles (handle potential NaN in title if any slipped through)
-            chunk_df['title_word_count'] = chunk_df['title'].fillna('').str.split().str.len()
+            # 4. Create a word count for titles as int16
+            # Counting runs of non-whitespace in one pass matches str.split() (utf8_split_whitespace
+            # would also count the empty pieces between repeated or leading/trailing spaces).
+            # RE2's \s and \pZ miss \v, \x1c-\x1f and \x85, which Python also splits on.
+            title_word_count = pc.count_substring_regex(table['title'], r'[^\s\x0b\x1c-\x1f\x85\pZ]+').cast(pa.int16())
+            table = table.append_column('title_word_count', title_word_count)
             # print("  - Created 'title_word_count' column.") # Too verbose
 
-            # 5. Drop columns with excessive missing values (done once, applies to all chunks conceptually)
-            # We handle this by simply not selecting them if we knew beforehand,
-            # or by dropping them from the final concatenated result.
-            # For chunking, it's easier to just not write them if we don't need them,
-            # or drop them from the *final* dataframe if needed after concatenation.
-            # Let's assume we want to keep most columns for flexibility, 
-            # and just not write the ones we identified as problematic *if they exist* in the chunk.
-            # However, dropping columns chunk-by-chunk is less efficient than selecting needed ones.
-            # Let's stick to processing and write all processed columns for now.
-            # If memory is still tight, specify `usecols` in pd.read_csv or drop here.
-            
-            # Example of dropping specific columns *if they exist in this chunk*:
-            cols_to_drop_if_present = ['journal', 'pmcid'] # Example
-            cols_actually_dropped = [col for col in cols_to_drop_if_present if col in chunk_df.columns]
-            if cols_actually_dropped:
-                chunk_df.drop(columns=cols_actually_dropped, inplace=True)
-                # print(f"  - Dropped columns: {cols_actually_dropped}") # Too verbose
+            # Columns with excessive missing values (e.g. 'journal', 'pmcid') are never read:
+            # only CLEANING_COLUMNS are parsed, which is cheaper than dropping them per chunk.
 
             # --- Write the cleaned chunk to the output file ---
-            rows_to_write = len(chunk_df)
+            rows_to_write = table.num_rows
             total_rows_kept += rows_to_write
             
             if rows_to_write > 0:
-                # Use mode='a' (append) for subsequent chunks, and avoid writing header again
-                write_header = first_chunk
-                chunk_df.to_csv(output_file, mode='a', index=False, header=write_header)
-                first_chunk = False # Set to False after the first chunk is written
+                # Open the writer on the first chunk; every chunk has the same schema.
+                # Pages are written through a pre-sized buffer instead of many small file writes.
+                if writer is None:
+                    sink = pa.output_stream(output_file, buffer_size=WRITE_BUFFER_SIZE)
+                    writer = pq.ParquetWriter(sink, table.schema, compression='zstd', use_dictionary=True)
+                writer.write_table(table)
+                # Distinct sources of this chunk: a handful of values from the dictionary-encoded column
+                sources_seen.update(pc.unique(table['source_x']).cast(pa.string()).drop_null().to_pylist())
                 print(f"  - Wrote {rows_to_write} rows to '{output_file}'.")
             else:
                  print(f"  - No rows to write for this chunk after cleaning.")
 
+        if writer is not None:
+            writer.close()
+            writer = None
+            sink.close() # The writer does not close a stream it was given
+            sink = None
+
+        with open(categories_file, 'w', encoding='utf-8') as f:
+            json.dump(sorted(sources_seen), f)
+
         print(f"\n--- Cleaning Process Complete ---")
         print(f"Total rows processed: {total_rows_processed}")
         print(f"Total rows kept/written: {total_rows_kept}")
         print(f"Cleaned data saved to '{output_file}'.")
+        print(f"Source categories ({len(sources_seen)}) saved to '{categories_file}'.")
 
         # Optional: Load the final file to get its shape (this might also cause memory issues if file is huge)
         # But for verification, we can just report the count.
-        # final_df = pd.read_csv(output_file)
-        # print(f"Final cleaned data shape: {final_df.shape}")
+        # final_table = pq.read_table(output_file)
+        # print(f"Final cleaned data shape: {final_table.shape}")
         # return final_df
         
         # Safer: Just return the count or None
@@ -100,30 +136,35 @@ def clean_data_chunked(input_file='metadata.csv', output_file='cleaned_data.csv'
     except FileNotFoundError:
         print(f"Error: Input file '{input_file}' not found.")
         return None
-    except pd.errors.EmptyDataError:
-        print(f"Error: Input file '{input_file}' is empty.")
+    except pa.ArrowInvalid as e:
+        print(f"Error: Could not read input file '{input_file}': {e}")
         return None
     except MemoryError as me:
         print(f"MemoryError encountered during chunking: {me}")
-        print("This is unexpected with chunking. Consider reducing chunksize or checking system resources.")
+        print("This is unexpected with chunking. Consider reducing block_size or checking system resources.")
         return None
     except Exception as e:
         import traceback
         print(f"An unexpected error occurred during cleaning: {e}")
         traceback.print_exc()
         return None
+    finally:
+        if writer is not None:
+            writer.close()
+        if sink is not None:
+            sink.close()
 
 if __name__ == "__main__":
     # --- Important: Remove any existing output file before starting ---
-    output_file = 'cleaned_data.csv'
+    output_file = 'cleaned_data.parquet'
     if os.path.exists(output_file):
         print(f"Removing existing '{output_file}'...")
         os.remove(output_file)
     
-    # You can experiment with different chunk sizes depending on your RAM.
-    # Smaller chunksize uses less memory but might be slower.
-    # Start with 10000, try 5000 or 20000 if needed.
-    result = clean_data_chunked(chunksize=10000) 
+    # You can experiment with different block sizes depending on your RAM.
+    # Smaller blocks use less memory but might be slower.
+    # Start with 64 MB, try 32 MB or 128 MB if needed.
+    result = clean_data_chunked(block_size=64 << 20)
     if result:
         print("Data cleaning script finished successfully (using chunking).")
     else:
@@ -1,28 +1,114 @@
 # data_exploration.py
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
+import csv
 
-def load_and_explore(file_path='metadata.csv'):
+def _empty_numeric_stats():
+    return {'count': 0, 'mean': 0.0, 'm2': 0.0, 'min': None, 'max': None}
+
+def _update_numeric_stats(stats, values):
+    """Merges one batch of float values into running stats (Chan et al. parallel variance)."""
+    batch_count = pc.count(values).as_py()
+    if batch_count == 0:
+        return
+    batch_mean = pc.mean(values).as_py()
+    batch_m2 = pc.variance(values, ddof=0).as_py() * batch_count
+    batch_min_max = pc.min_max(values).as_py()
+
+    total = stats['count'] + batch_count
+    delta = batch_mean - stats['mean']
+    stats['mean'] += delta * batch_count / total
+    stats['m2'] += batch_m2 + delta * delta * stats['count'] * batch_count / total
+    stats['count'] = total
+    stats['min'] = batch_min_max['min'] if stats['min'] is None else min(stats['min'], batch_min_max['min'])
+    stats['max'] = batch_min_max['max'] if stats['max'] is None else max(stats['max'], batch_min_max['max'])
+
+def _describe_numeric_stats(numeric_stats):
+    """Formats running stats like DataFrame.describe() (quartiles need a second pass, so they are omitted)."""
+    rows = {}
+    for name, stats in numeric_stats.items():
+        count = stats['count']
+        rows[name] = {
+            'count': float(count),
+            'mean': stats['mean'] if count else float('nan'),
+            'std': (stats['m2'] / (count - 1)) ** 0.5 if count > 1 else float('nan'),
+            'min': stats['min'] if count else float('nan'),
+            'max': stats['max'] if count else float('nan'),
+        }
+    return pd.DataFrame(rows, index=['count', 'mean', 'std', 'min', 'max'])
+
+def load_and_explore(file_path='metadata.csv', block_size=32 << 20):
     """
-    Loads the CORD-19 metadata, performs basic exploration,
-    and prints findings to the console.
+    Streams the CORD-19 metadata in Arrow record batches, performs basic exploration,
+    and prints findings to the console without loading the whole file into memory.
+    Row/null counts and numeric statistics cover the full file; the preview rows and
+    column information come from the first batch.
     """
     try:
-        print("Loading data...")
-        df = pd.read_csv(file_path)
-        print("Data loaded successfully.\n")
+        print("Loading data (streaming)...")
+        # --- Read only the header line to learn the column names ---
+        # utf-8-sig drops a leading BOM, as Arrow does, so the names match the batch schema
+        with open(file_path, newline='', encoding='utf-8-sig') as f:
+            header = next(csv.reader(f), None)
+        if not header:
+            print(f"Error: File '{file_path}' is empty.")
+            return None
+
+        # Every column is read as a string: Arrow infers types from the first block only
+        # and fails if a later block disagrees. Numeric columns are detected per batch below.
+        reader = pa_csv.open_csv(
+            file_path,
+            read_options=pa_csv.ReadOptions(block_size=block_size, use_threads=True),
+            convert_options=pa_csv.ConvertOptions(column_types={col: pa.string() for col in header},
+                                                  strings_can_be_null=True),
+        )
+
+        first_batch = None
+        num_rows = 0
+        null_counts = dict.fromkeys(header, 0)
+        # Running count/mean/M2/min/max per column whose values all parse as numbers
+        numeric_stats = {}
+        non_numeric = set()
+        for batch in reader:
+            if first_batch is None:
+                first_batch = batch
+            num_rows += batch.num_rows
+            for name, column in zip(batch.schema.names, batch.columns):
+                null_counts[name] += column.null_count
+                if name in non_numeric:
+                    continue
+                try:
+                    values = pc.cast(column, pa.float64())
+                except pa.ArrowInvalid:
+                    # Like pandas, a column with any non-numeric value is left out of describe()
+                    non_numeric.add(name)
+                    numeric_stats.pop(name, None)
+                    continue
+                _update_numeric_stats(numeric_stats.setdefault(name, _empty_numeric_stats()), values)
+        print("Data streamed successfully.\n")
+
+        if first_batch is None:
+            preview_df = pd.DataFrame(columns=header)
+        else:
+            # Give numeric columns their numeric type in the preview, as read_csv would
+            preview_df = first_batch.to_pandas()
+            for name in numeric_stats:
+                preview_df[name] = pd.to_numeric(preview_df[name])
 
         print("--- Data Overview ---")
-        print(f"Shape (rows, columns): {df.shape}")
+        print(f"Shape (rows, columns): {(num_rows, len(header))}")
         print("\nFirst few rows:")
-        print(df.head())
-        print("\nColumn information:")
-        print(df.info())
+        print(preview_df.head())
+        print(f"\nColumn information (first {len(preview_df):,} rows):")
+        preview_df.info()
         print("\nMissing values per column:")
-        print(df.isnull().sum())
+        print(pd.Series(null_counts))
         print("\nBasic statistics for numerical columns:")
-        print(df.describe())
+        print(_describe_numeric_stats(numeric_stats))
 
-        return df # Return the dataframe for potential use in other scripts
+        return preview_df # Return the preview for potential use in other scripts
 
     except FileNotFoundError:
         print(f"Error: File '{file_path}' not found. Please check the path.")
@@ -33,4 +119,4 @@ def load_and_explore(file_path='metadata.csv'):
 
 if __name__ == "__main__":
     df = load_and_explore()
-    # You can save basic info to a file if needed, but printing is sufficient for exploration
\ No newline at end of file
+    # You can save basic info to a file if needed, but printing is sufficient for exploration